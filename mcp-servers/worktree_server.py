@@ -7,42 +7,232 @@ workflow is 'adhoc': branch from origin/main, do the work, commit, done.
 The user reviews changes in the worktree branch independently.
 """
 
+import asyncio
+import hashlib
 import json
+import os
 import re
+import secrets
+import signal
 import subprocess
-import uuid
+import time
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
 from fastmcp import FastMCP
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 mcp = FastMCP("worktrees")
 
 
+def _env_number(name: str, convert, default):
+    """Read a numeric setting from the environment. Unset or malformed values
+    (e.g. WORKTREE_GIT_JOBS=auto) fall back to default instead of failing at
+    import, which would keep the server from starting at all.
+    """
+    try:
+        return convert(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def _default_git_jobs() -> int:
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS/Windows
+        cpus = os.cpu_count() or 4
+    return min(cpus, 8)
+
+
+# Cap concurrent git processes so parallel tool calls don't thrash the disk.
+# At least 1: a zero-permit semaphore would make every git call wait forever
+GIT_JOBS = max(1, _env_number("WORKTREE_GIT_JOBS", int, _default_git_jobs()))
+_git_gate = asyncio.Semaphore(GIT_JOBS)
+
+# Seconds to wait on `git fetch` (network) before giving up. 0, negative or
+# non-finite values mean no timeout rather than failing every fetch at once
+FETCH_TIMEOUT = _env_number("WORKTREE_FETCH_TIMEOUT", float, 120.0)
+if not 0 < FETCH_TIMEOUT < float("inf"):
+    FETCH_TIMEOUT = None
+
+# Optional directory to hold worktrees instead of the repo's parent. Resolved
+# once so a relative value means the same place to mkdir and to git (cwd=repo)
+WORKTREE_ROOT = (
+    Path(os.environ["WORKTREE_ROOT"]).expanduser().resolve()
+    if os.environ.get("WORKTREE_ROOT")
+    else None
+)
+
+# Pretty-print tool responses (debugging aid); MCP clients don't need it
+PRETTY_JSON = os.environ.get("WORKTREE_PRETTY_JSON", "").lower() in ("1", "true", "yes")
+
+# Maximum number of `git status --short` entries returned by worktree_status.
+# The worktree_status docstring (sent to clients) states this number; keep in sync
+MAX_STATUS_ENTRIES = 200
+
+# Characters dropped from task descriptions when building branch slugs
+_SLUG_STRIP_RE = re.compile(r"[^a-zA-Z0-9 ]+")
+
+# Paths already confirmed to be git repositories
+_known_repos: set[Path] = set()
+
+# Repository discovery scans of a directory, reused for REPO_SCAN_TTL seconds
+REPO_SCAN_TTL = 2.0
+_repo_scan_cache: dict[Path, tuple[float, list[Path]]] = {}
+
+# Per-repository locks for operations that mutate shared git metadata
+_repo_locks: dict[Path, asyncio.Lock] = {}
+
+# Per-worktree locks for operations that mutate one worktree's index and branch
+_worktree_locks: dict[Path, asyncio.Lock] = {}
+
+
 # ============================================================================
 # Helpers
 # ============================================================================
 
-def _run(cmd: list[str], cwd: Path) -> subprocess.CompletedProcess:
-    return subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
+def _repo_lock(repo: Path) -> asyncio.Lock:
+    """Lock serializing fetch and worktree add/remove on one repository.
+    Concurrent calls would race on ref locks and .git/worktrees metadata.
+    """
+    return _repo_locks.setdefault(repo, asyncio.Lock())
+
+
+def _worktree_lock(wt: Path) -> asyncio.Lock:
+    """Lock serializing the stage/check/commit sequence in one worktree.
+    Concurrent calls would both pass the pending-changes check and the
+    second commit would fail with nothing to commit.
+    """
+    return _worktree_locks.setdefault(wt, asyncio.Lock())
+
+
+async def _run(
+    cmd: list[str],
+    cwd: Path,
+    timeout: Optional[float] = None,
+    capture_stdout: bool = True,
+) -> subprocess.CompletedProcess:
+    """Run a command without blocking the event loop and capture its output.
+    If timeout (seconds) expires, the process and everything it spawned
+    (e.g. ssh for a fetch) are killed and a failed result with returncode -1
+    is returned. Pass capture_stdout=False when only the
+    exit code and stderr matter; stdout then goes to /dev/null and is "".
+    stderr is only decoded for failed commands and is "" otherwise.
+    """
+    async with _git_gate:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=cwd,
+            stdout=asyncio.subprocess.PIPE if capture_stdout else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            # Own process group, so a timeout can kill git's helpers too
+            start_new_session=True,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            # Killing only git would leave e.g. ssh holding the stderr pipe
+            # open, and wait() would block until it exits on its own
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await proc.wait()
+            return subprocess.CompletedProcess(cmd, -1, "", f"Command timed out after {timeout}s")
+    # Callers only read stderr on failure, so skip decoding it otherwise
+    return subprocess.CompletedProcess(
+        cmd,
+        proc.returncode,
+        stdout.decode() if stdout else "",
+        stderr.decode(errors="replace") if proc.returncode != 0 else "",
+    )
+
+
+def _dumps(obj: dict) -> str:
+    """Serialize a tool response, using orjson when it is installed.
+    Output is compact unless WORKTREE_PRETTY_JSON is set.
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if PRETTY_JSON else 0).decode()
+    if PRETTY_JSON:
+        return json.dumps(obj, indent=2)
+    return json.dumps(obj, separators=(",", ":"))
 
 
 def _task_slug(task: str, max_len: int = 30) -> str:
-    slug = re.sub(r"[^a-zA-Z0-9 ]", "", task[:max_len])
+    slug = _SLUG_STRIP_RE.sub("", task[:max_len])
     return slug.strip().replace(" ", "-").lower()
 
 
+def _parse_branch_header(header: str) -> str:
+    """Extract the branch name from a `git status --branch` header line."""
+    head = header[len("## "):]
+    for prefix in ("No commits yet on ", "Initial commit on "):
+        if head.startswith(prefix):
+            return head[len(prefix):]
+    if head.startswith("HEAD (no branch)"):
+        return "HEAD"
+    return head.split("...", 1)[0].split(" ", 1)[0]
+
+
+def _worktrees_dir(repo: Path) -> Path:
+    """Directory holding all worktrees created for repo. A sibling of the repo
+    (<repo>.worktrees) by default; WORKTREE_ROOT relocates it (e.g. to a
+    tmpfs) as <repo>-<hash>.worktrees, the hash of the repo path keeping
+    same-named repos from different parents apart.
+    """
+    if WORKTREE_ROOT is None:
+        return repo.parent / f"{repo.name}.worktrees"
+    digest = hashlib.sha1(str(repo).encode()).hexdigest()[:8]
+    return WORKTREE_ROOT / f"{repo.name}-{digest}.worktrees"
+
+
+def _is_git_repo(path: Path) -> bool:
+    """True if path has a .git directory or gitfile (linked worktrees,
+    submodules). Positive results are cached for the process lifetime;
+    negative results are rechecked so a fresh `git init` is picked up.
+    """
+    if path in _known_repos:
+        return True
+    if (path / ".git").exists():
+        _known_repos.add(path)
+        return True
+    return False
+
+
+def _find_git_repos(parent: Path) -> list[Path]:
+    """List the git repositories directly under parent. Results are reused
+    for REPO_SCAN_TTL seconds so back-to-back tool calls skip the rescan.
+    """
+    now = time.monotonic()
+    cached = _repo_scan_cache.get(parent)
+    if cached and now - cached[0] < REPO_SCAN_TTL:
+        return cached[1]
+
+    # scandir's DirEntry answers is_dir() from the directory listing itself,
+    # saving a stat per entry over Path.iterdir() + Path.is_dir()
+    with os.scandir(parent) as entries:
+        dirs = [Path(e.path) for e in entries if e.is_dir()]
+    repos = [d for d in dirs if _is_git_repo(d)]
+    _repo_scan_cache[parent] = (now, repos)
+    return repos
+
+
 def _resolve_repo(repo_path: Optional[str]) -> tuple[Optional[Path], str]:
     """Resolve repo_path to an absolute Path. Returns (path, error_message).
     If repo_path is omitted, looks for a single git repo under cwd.
     On error, path is None and error_message is non-empty.
     """
-    cwd = Path.cwd()
     if repo_path:
         p = Path(repo_path).expanduser().resolve()
     else:
-        candidates = [d for d in cwd.iterdir() if d.is_dir() and (d / ".git").exists()]
+        candidates = _find_git_repos(Path.cwd())
         if len(candidates) == 0:
             return None, "No git repository found. Provide repo_path."
         if len(candidates) > 1:
@@ -52,7 +242,7 @@ def _resolve_repo(repo_path: Optional[str]) -> tuple[Optional[Path], str]:
 
     if not p.exists():
         return None, f"Path does not exist: {p}"
-    if not (p / ".git").exists():
+    if not _is_git_repo(p):
         return None, f"Not a git repository: {p}"
     return p, ""
 
@@ -62,9 +252,10 @@ def _resolve_repo(repo_path: Optional[str]) -> tuple[Optional[Path], str]:
 # ============================================================================
 
 @mcp.tool()
-def create_adhoc_worktree(
+async def create_adhoc_worktree(
     task: str,
     repo_path: Optional[str] = None,
+    fetch: bool = True,
 ) -> str:
     """Create a git worktree branched from origin/main for an ad-hoc task.
 
@@ -77,37 +268,59 @@ def create_adhoc_worktree(
         task: Short description of the task (used for branch/directory naming).
         repo_path: Absolute or relative path to the git repository. If omitted,
                    looks for a single repo in the current working directory.
+        fetch: Fetch origin/main first. Pass False to skip the network round
+               trip and branch from the locally known origin/main (e.g. when
+               creating several worktrees in a row).
 
     Returns:
         JSON with worktree_path, branch, and instructions.
     """
     repo, err = _resolve_repo(repo_path)
     if err:
-        return json.dumps({"error": err})
+        return _dumps({"error": err})
     if repo is None:
-        return json.dumps({"error": "Could not resolve repository"})
-
-    # Fetch latest
-    fetch = _run(["git", "fetch", "origin"], repo)
-    if fetch.returncode != 0:
-        return json.dumps({"error": f"git fetch failed: {fetch.stderr.strip()}"})
+        return _dumps({"error": "Could not resolve repository"})
 
-    worktree_id = str(uuid.uuid4())[:8]
+    worktree_id = secrets.token_hex(4)
     slug = _task_slug(task)
     branch = f"adhoc-{worktree_id}-{slug}"
 
-    worktrees_dir = repo.parent / f"{repo.name}.worktrees"
-    worktrees_dir.mkdir(exist_ok=True)
+    worktrees_dir = _worktrees_dir(repo)
     worktree_path = worktrees_dir / branch
 
-    result = _run(
-        ["git", "worktree", "add", "-b", branch, str(worktree_path), "origin/main"],
-        repo,
-    )
-    if result.returncode != 0:
-        return json.dumps({"error": f"git worktree add failed: {result.stderr.strip()}"})
-
-    return json.dumps(
+    async with _repo_lock(repo):
+        if fetch:
+            # Only main is needed; git still updates origin/main from it
+            fetch_result = await _run(
+                ["git", "fetch", "--quiet", "origin", "main"],
+                repo,
+                timeout=FETCH_TIMEOUT,
+                capture_stdout=False,
+            )
+            if fetch_result.returncode != 0:
+                return _dumps({"error": f"git fetch failed: {fetch_result.stderr.strip()}"})
+
+        # Created only once the fetch succeeded, so failures leave nothing behind
+        worktrees_dir.mkdir(parents=True, exist_ok=True)
+
+        # checkout.workers=0 writes the new working tree with one worker per
+        # CPU (git's parallel checkout) instead of a single sequential pass
+        result = await _run(
+            [
+                "git", "-c", "checkout.workers=0",
+                "worktree", "add", "--quiet", "-b", branch, str(worktree_path), "origin/main",
+            ],
+            repo,
+            capture_stdout=False,
+        )
+        if result.returncode != 0:
+            try:
+                worktrees_dir.rmdir()  # only succeeds if no other worktrees remain
+            except OSError:
+                pass
+            return _dumps({"error": f"git worktree add failed: {result.stderr.strip()}"})
+
+    return _dumps(
         {
             "worktree_path": str(worktree_path),
             "branch": branch,
@@ -118,13 +331,12 @@ def create_adhoc_worktree(
                 f"Do the work inside {worktree_path}, "
                 "then call commit_worktree with that path and a commit message."
             ),
-        },
-        indent=2,
+        }
     )
 
 
 @mcp.tool()
-def commit_worktree(
+async def commit_worktree(
     worktree_path: str,
     message: str,
 ) -> str:
@@ -139,41 +351,44 @@ def commit_worktree(
     """
     wt = Path(worktree_path).expanduser().resolve()
     if not wt.exists():
-        return json.dumps({"error": f"Worktree path does not exist: {wt}"})
-
-    # Check for changes
-    status = _run(["git", "status", "--porcelain"], wt)
-    if status.returncode != 0:
-        return json.dumps({"error": f"git status failed: {status.stderr.strip()}"})
-    if not status.stdout.strip():
-        return json.dumps({"error": "No changes to commit in worktree."})
-
-    add = _run(["git", "add", "-A"], wt)
-    if add.returncode != 0:
-        return json.dumps({"error": f"git add failed: {add.stderr.strip()}"})
-
-    commit = _run(["git", "commit", "-m", message], wt)
-    if commit.returncode != 0:
-        return json.dumps({"error": f"git commit failed: {commit.stderr.strip()}"})
-
-    # Get the new SHA
-    sha_result = _run(["git", "rev-parse", "--short", "HEAD"], wt)
-    sha = sha_result.stdout.strip() if sha_result.returncode == 0 else "unknown"
-
-    return json.dumps(
+        return _dumps({"error": f"Worktree path does not exist: {wt}"})
+
+    async with _worktree_lock(wt):
+        add = await _run(["git", "add", "-A"], wt, capture_stdout=False)
+        if add.returncode != 0:
+            return _dumps({"error": f"git add failed: {add.stderr.strip()}"})
+
+        # Check for staged changes by exit code only (1 = changes) rather than
+        # having git print the full status listing
+        diff = await _run(["git", "diff", "--cached", "--quiet"], wt, capture_stdout=False)
+        if diff.returncode == 0:
+            return _dumps({"error": "No changes to commit in worktree."})
+        if diff.returncode != 1:
+            return _dumps({"error": f"git diff failed: {diff.stderr.strip()}"})
+
+        # git reports some failures (e.g. nothing to commit) on stdout only
+        commit = await _run(["git", "commit", "--quiet", "-m", message], wt)
+        if commit.returncode != 0:
+            detail = commit.stderr.strip() or commit.stdout.strip()
+            return _dumps({"error": f"git commit failed: {detail}"})
+
+        # Get the new SHA
+        sha_result = await _run(["git", "rev-parse", "--short", "HEAD"], wt)
+        sha = sha_result.stdout.strip() if sha_result.returncode == 0 else "unknown"
+
+    return _dumps(
         {
             "committed": True,
             "sha": sha,
             "worktree_path": str(wt),
             "message": message,
             "note": "Changes are committed in the worktree branch. The user will review them.",
-        },
-        indent=2,
+        }
     )
 
 
 @mcp.tool()
-def list_worktrees(repo_path: Optional[str] = None) -> str:
+async def list_worktrees(repo_path: Optional[str] = None) -> str:
     """List all git worktrees for a repository.
 
     Args:
@@ -185,13 +400,13 @@ def list_worktrees(repo_path: Optional[str] = None) -> str:
     """
     repo, err = _resolve_repo(repo_path)
     if err:
-        return json.dumps({"error": err})
+        return _dumps({"error": err})
     if repo is None:
-        return json.dumps({"error": "Could not resolve repository"})
+        return _dumps({"error": "Could not resolve repository"})
 
-    result = _run(["git", "worktree", "list", "--porcelain"], repo)
+    result = await _run(["git", "worktree", "list", "--porcelain"], repo)
     if result.returncode != 0:
-        return json.dumps({"error": f"git worktree list failed: {result.stderr.strip()}"})
+        return _dumps({"error": f"git worktree list failed: {result.stderr.strip()}"})
 
     worktrees = []
     current: dict = {}
@@ -209,11 +424,11 @@ def list_worktrees(repo_path: Optional[str] = None) -> str:
     if current:
         worktrees.append(current)
 
-    return json.dumps({"repo": str(repo), "worktrees": worktrees}, indent=2)
+    return _dumps({"repo": str(repo), "worktrees": worktrees})
 
 
 @mcp.tool()
-def remove_worktree(
+async def remove_worktree(
     branch: str,
     repo_path: Optional[str] = None,
     force: bool = False,
@@ -231,65 +446,88 @@ def remove_worktree(
     """
     repo, err = _resolve_repo(repo_path)
     if err:
-        return json.dumps({"error": err})
+        return _dumps({"error": err})
     if repo is None:
-        return json.dumps({"error": "Could not resolve repository"})
+        return _dumps({"error": "Could not resolve repository"})
 
     # Derive the worktree path from the branch name
-    worktrees_dir = repo.parent / f"{repo.name}.worktrees"
-    worktree_path = worktrees_dir / branch
+    worktree_path = _worktrees_dir(repo) / branch
 
     remove_cmd = ["git", "worktree", "remove", str(worktree_path)]
     if force:
         remove_cmd.append("--force")
 
-    remove = _run(remove_cmd, repo)
-    if remove.returncode != 0:
-        return json.dumps({"error": f"git worktree remove failed: {remove.stderr.strip()}"})
+    async with _repo_lock(repo):
+        remove = await _run(remove_cmd, repo, capture_stdout=False)
+        if remove.returncode != 0:
+            return _dumps({"error": f"git worktree remove failed: {remove.stderr.strip()}"})
+
+        # Delete the branch
+        delete_branch = await _run(["git", "branch", "-D", branch], repo, capture_stdout=False)
+        branch_deleted = delete_branch.returncode == 0
 
-    # Delete the branch
-    delete_branch = _run(["git", "branch", "-D", branch], repo)
-    branch_deleted = delete_branch.returncode == 0
+    # git already removed the worktree's files; drop the shared worktrees
+    # directory too once it is empty (rmdir refuses while others remain)
+    try:
+        worktree_path.parent.rmdir()
+    except OSError:
+        pass
 
-    return json.dumps(
+    return _dumps(
         {
             "removed": True,
             "worktree_path": str(worktree_path),
             "branch": branch,
             "branch_deleted": branch_deleted,
-        },
-        indent=2,
+        }
     )
 
 
 @mcp.tool()
-def worktree_status(worktree_path: str) -> str:
+async def worktree_status(worktree_path: str) -> str:
     """Show git status and recent commits inside a worktree.
 
     Args:
         worktree_path: Absolute path to the worktree directory.
 
     Returns:
-        JSON with status output and last few commits.
+        JSON with status output and last few commits. The status listing is
+        capped at 200 entries; status_truncated and status_entries (the
+        full count) are set when it was cut short.
     """
     wt = Path(worktree_path).expanduser().resolve()
     if not wt.exists():
-        return json.dumps({"error": f"Worktree path does not exist: {wt}"})
-
-    status = _run(["git", "status", "--short"], wt)
-    log = _run(["git", "log", "--oneline", "-5"], wt)
-    branch_result = _run(["git", "rev-parse", "--abbrev-ref", "HEAD"], wt)
+        return _dumps({"error": f"Worktree path does not exist: {wt}"})
 
-    return json.dumps(
-        {
-            "worktree_path": str(wt),
-            "branch": branch_result.stdout.strip() if branch_result.returncode == 0 else "unknown",
-            "status": status.stdout.strip() if status.returncode == 0 else status.stderr.strip(),
-            "recent_commits": log.stdout.strip() if log.returncode == 0 else log.stderr.strip(),
-        },
-        indent=2,
+    # --branch folds the current branch into the status output as a "## ..."
+    # header, so no separate rev-parse is needed; log runs concurrently
+    status, log = await asyncio.gather(
+        _run(["git", "status", "--short", "--branch"], wt),
+        _run(["git", "log", "--oneline", "-5"], wt),
     )
 
+    branch = "unknown"
+    status_text = status.stderr.strip()
+    total_entries = 0
+    if status.returncode == 0:
+        header, _, entries = status.stdout.partition("\n")
+        branch = _parse_branch_header(header)
+        # Bound the listing so a very dirty worktree doesn't bloat the response
+        lines = entries.strip().splitlines()
+        total_entries = len(lines)
+        status_text = "\n".join(lines[:MAX_STATUS_ENTRIES])
+
+    response = {
+        "worktree_path": str(wt),
+        "branch": branch,
+        "status": status_text,
+        "recent_commits": log.stdout.strip() if log.returncode == 0 else log.stderr.strip(),
+    }
+    if total_entries > MAX_STATUS_ENTRIES:
+        response["status_truncated"] = True
+        response["status_entries"] = total_entries
+    return _dumps(response)
+
 
 if __name__ == "__main__":
     mcp.run()